@@ -9,12 +9,21 @@
 # 2] The reference input title does not match the title in the Crossref Database
 # Version log: v4.1 has a "wildcard tolerance"; allows a certain amount of typos & handles pasted text as input
 
+import os
 import re
+import json
 import time
-import requests
-from io import BytesIO
-import mammoth
+import sqlite3
+import asyncio
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+from io import BytesIO, StringIO
+from collections.abc import Iterator
+import httpx
 import streamlit as st
+from rapidfuzz import fuzz
+from rapidfuzz.distance import Levenshtein
 
 st.set_page_config(page_title="Fabricated Reference Checker v4.0")
 st.title("Fabricated Reference Checker v4.0")
@@ -59,150 +68,467 @@ if confirm_wc:
 # ----------------------------------------------------------------------
 # Helper Functions
 # ----------------------------------------------------------------------
-def normalize_text(raw: str) -> str:
-    text = raw.replace('\r\n', '\n').replace('\r', '\n')
-    lines = text.split('\n')
-    merged = []
-    buffer = ""
-    for line in lines:
-        stripped = line.rstrip()
-        if not stripped:
+HEADINGS = [
+    "References", "Referenties", "Reference", "Citations",
+    "Bibliography", "Literature Cited", "Sources", "Work cited"
+]
+
+_HEADING_NAMES = frozenset(h.lower() for h in HEADINGS)
+_HEADING_MAX_LEN = max(map(len, HEADINGS))
+_HEADING_INITIALS = frozenset(h[0] for h in HEADINGS) | frozenset(h[0].lower() for h in HEADINGS)
+_ASCII_ALNUM = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789")
+
+# Patterns are compiled once here rather than on every call
+# A reference starts at a numbered marker or an "Author, X. (Year)" line; both are tried in one match.
+# The marker alternation is written as \d+[.)] so the digits are scanned once, not once per suffix
+_REF_START_RE = re.compile(r'(?:\[\d+\]|\d+[.)])(?P<space>\s+|$)|(?P<author>[A-Z][a-z]+, .*?\(\d{4}\))')
+_NUMBER_ONLY_RE = re.compile(r'\[\d+\]|\d+[.)]')
+_DOI_RE = re.compile(r'(10\.\d{4,9}/[-._;()/:A-Z0-9]+)', re.I)
+_DOI_SUFFIX_RE = re.compile(r'(?=.*[A-Z0-9])[-._;()/:A-Z0-9]+', re.I)
+_DOI_MAX_LEN = 256
+_NONWORD_RE = re.compile(r'\W+')
+# 256-byte lower-casing table and the ASCII bytes \W matches, for bytes.translate
+_ASCII_LOWER = bytes(range(256)).lower()
+_ASCII_NONWORD = bytes(c for c in range(128) if not (chr(c).isalnum() or c == ord('_')))
+
+
+def ends_reference_line(line: str) -> bool:
+    # A line ending in a letter or digit, optionally followed by . ? ! ; or :
+    last = line[-1]
+    if last in ".?!;:":
+        return len(line) > 1 and line[-2] in _ASCII_ALNUM
+    return last in _ASCII_ALNUM
+
+
+def is_heading_line(line: str) -> bool:
+    # A line that holds nothing but one of HEADINGS
+    heading = line.strip()
+    return len(heading) <= _HEADING_MAX_LEN and heading.lower() in _HEADING_NAMES
+
+
+def iter_lines(raw: str) -> Iterator[str]:
+    # Like raw.split("\n") after normalizing \r\n and \r, without building the list
+    line = "\n"
+    for line in StringIO(raw, newline=None):
+        yield line
+    if line.endswith("\n"):
+        yield ""
+
+
+def iter_logical_lines(raw: str) -> Iterator[str]:
+    # Yields the pasted lines with heading lines blanked and lines broken mid-reference rejoined;
+    # a line not passing ends_reference_line is merged with the next non-blank line
+    buffer = []
+    for line in iter_lines(raw):
+        line = line.rstrip()
+        if is_heading_line(line):
+            line = ""
+        if not line:
             if buffer:
-                merged.append(buffer.strip())
-                buffer = ""
-            merged.append("")
-        elif re.search(r'[A-Za-z0-9][\.\?\!;:]?\s*$', stripped):
+                yield " ".join(buffer).strip()
+                buffer = []
+            yield ""
+        elif ends_reference_line(line):
             if buffer:
-                merged.append((buffer + " " + stripped).strip())
-                buffer = ""
+                buffer.append(line)
+                yield " ".join(buffer).strip()
+                buffer = []
             else:
-                merged.append(stripped)
+                yield line
         else:
-            buffer = (buffer + " " + stripped).strip() if buffer else stripped
+            buffer.append(line)
     if buffer:
-        merged.append(buffer.strip())
-    return "\n".join(merged)
-
-
-def split_references(text: str) -> list[str]:
-    author_year_pattern = re.compile(r'^(?=[A-Z][a-z]+, .*?\(\d{4}\))', re.MULTILINE)
-    text = author_year_pattern.sub('\n', text)
-    splitter = re.compile(
-        r'(?:^(?:\[\d+\]|\d+\.)\s+)|'
-        r'(?:^(?:\d+\))\s+)|'
-        r'(?:\n{2,})',
-        re.MULTILINE
-    )
-    parts = splitter.split(text)
-    refs = []
-    for part in parts:
-        part = part.strip()
-        if not part or re.fullmatch(r'\[\d+\]|\d+\.|\d+\)', part):
+        yield " ".join(buffer).strip()
+
+
+def join_reference(lines: list[str]) -> str | None:
+    ref = "\n".join(lines).strip()
+    return ref if ref and not _NUMBER_ONLY_RE.fullmatch(ref) else None
+
+
+def iter_references(raw: str) -> Iterator[str]:
+    """Split pasted text into references in a single pass over its lines.
+
+    A reference ends at a blank line and a new one starts at a numbered marker
+    ([1], 1., 1)) or at an "Author, X. (Year)" line.
+    """
+    lines = []
+    marker = None  # a marker alone on its line only starts a reference if more text follows
+    for line in iter_logical_lines(raw):
+        if marker is not None:
+            if ref := join_reference(lines):
+                yield ref
+            lines = []
+            marker = None
+        if not line:
+            if ref := join_reference(lines):
+                yield ref
+            lines = []
             continue
-        refs.append(part)
-    return refs
-
-
-def remove_heading(text: str) -> str:
-    headings = [
-        "References", "Referenties", "Reference", "Citations",
-        "Bibliography", "Literature Cited", "Sources", "Work cited"
-    ]
-    pattern = re.compile(r'^\s*(?:' + "|".join(headings) + r')\s*$', re.IGNORECASE | re.MULTILINE)
-    return pattern.sub("", text)
+        m = _REF_START_RE.match(line)
+        if m is None:
+            lines.append(line)
+        elif m.group("author"):
+            if ref := join_reference(lines):
+                yield ref
+            lines = [line]
+        elif not m.group("space"):
+            marker = line
+        else:
+            if ref := join_reference(lines):
+                yield ref
+            lines = [line[m.end():]]
+    if marker is not None:
+        lines.append(marker)
+    if ref := join_reference(lines):
+        yield ref
 
 
 def extract_doi(text: str) -> str | None:
-    m = re.search(r'(10\.\d{4,9}/[-._;()/:A-Z0-9]+)', text, re.I)
+    m = _DOI_RE.search(text)
     return m.group(1).rstrip(' .;,') if m else None
 
 
-def check_crossref(query: str):
-    if query and query.startswith("10."):
-        resp = requests.get(f"https://api.crossref.org/works/{query}")
-    else:
-        resp = requests.get("https://api.crossref.org/works", params={"query.title": query or "", "rows": 1})
-    time.sleep(1)
-    if resp.status_code == 200:
-        msg = resp.json().get("message", {})
-        return (msg["items"][0] if "items" in msg and msg["items"] else msg) or None
-    return None
-
-
-def levenshtein(s1: str, s2: str) -> int:
-    if len(s1) < len(s2):
-        return levenshtein(s2, s1)
-    if len(s2) == 0:
-        return len(s1)
-    previous_row = range(len(s2) + 1)
-    for i, c1 in enumerate(s1):
-        current_row = [i + 1]
-        for j, c2 in enumerate(s2):
-            insertions = previous_row[j + 1] + 1
-            deletions = current_row[j] + 1
-            substitutions = previous_row[j] + (c1 != c2)
-            current_row.append(min(insertions, deletions, substitutions))
-        previous_row = current_row
-    return previous_row[-1]
-
-
-def is_title_in_reference(crossref_title: str, ref_text: str, tolerance: int = 0) -> tuple[bool, bool]:
-    normalize = lambda s: re.sub(r'\W+', '', s).lower()
-    ct = normalize(crossref_title)
-    rt = normalize(ref_text)
+def is_plausible_doi(doi: str) -> bool:
+    # Local syntax checks that reject regex false positives (e.g. "10.1234/)." cut from a
+    # sentence) without a Crossref request; such strings could also fail a whole batch query
+    suffix = doi.partition("/")[2]
+    return (len(doi) <= _DOI_MAX_LEN and _DOI_SUFFIX_RE.fullmatch(suffix) is not None
+            and suffix.count("(") == suffix.count(")"))
+
+
+# Requests that identify a contact address (CROSSREF_MAILTO) are served from Crossref's
+# polite pool: 10 requests per second and 3 at a time, instead of 5 per second and 1 at a time
+CROSSREF_API = "https://api.crossref.org/works"
+CROSSREF_MAILTO = os.environ.get("CROSSREF_MAILTO", "")
+CROSSREF_USER_AGENT = f"FabRefChecker/4.0 (mailto:{CROSSREF_MAILTO})" if CROSSREF_MAILTO else "FabRefChecker/4.0"
+CROSSREF_CONCURRENCY = 3 if CROSSREF_MAILTO else 1
+CROSSREF_RATE = 10 if CROSSREF_MAILTO else 5
+CROSSREF_BATCH_SIZE = 20
+CROSSREF_MAX_FILTER_LEN = 2000  # characters of filter=doi:... per request; longer URLs risk HTTP 414
+CROSSREF_BACKOFF = (0.5, 1, 2)  # seconds to wait before each retry after HTTP 429
+
+
+class RateLimiter:
+    """Token bucket that follows the X-Rate-Limit-Limit / X-Rate-Limit-Interval headers."""
+
+    def __init__(self, limit: int, interval: float = 1.0):
+        self.configure(limit, interval)
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+
+    def configure(self, limit: int, interval: float) -> None:
+        self.capacity = float(limit)
+        self.fill_rate = limit / interval
+
+    def update(self, headers) -> None:
+        try:
+            limit = int(headers["X-Rate-Limit-Limit"])
+            interval = float(headers["X-Rate-Limit-Interval"].rstrip("s"))
+        except (KeyError, ValueError):
+            return
+        if limit > 0 and interval > 0:
+            self.configure(limit, interval)
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.fill_rate)
+
+
+crossref_semaphore = asyncio.Semaphore(CROSSREF_CONCURRENCY)
+crossref_limiter = RateLimiter(CROSSREF_RATE)
+
+# DOI lookups are cached in memory for the server process and on disk across restarts
+CACHE_PATH = os.path.expanduser("~/.fabrefchecker_cache.sqlite")
+CACHE_TTL = 90 * 24 * 3600
+CACHE_MISS_TTL = 24 * 3600  # DOIs Crossref didn't know are cached as {} and asked about again after a day
+
+
+@st.cache_resource
+def open_cache() -> tuple[sqlite3.Connection, threading.Lock]:
+    # The connection is shared by every session's script thread, so all use of it goes through the lock
+    conn = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS crossref (doi TEXT PRIMARY KEY, json TEXT, fetched_at INTEGER)")
+    return conn, threading.Lock()
+
+
+@st.cache_resource
+def memory_cache() -> dict:
+    return {}
+
+
+def load_cached(doi: str) -> dict | None:
+    key = doi.lower()
+    hit = memory_cache().get(key)
+    if hit is None:
+        conn, lock = open_cache()
+        with lock:
+            row = conn.execute("SELECT json, fetched_at FROM crossref WHERE doi = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        hit = memory_cache()[key] = (json.loads(row[0]), row[1])
+    entry, fetched_at = hit
+    return entry if time.time() - fetched_at < (CACHE_TTL if entry else CACHE_MISS_TTL) else None
+
+
+def store_cached(doi: str, entry: dict) -> None:
+    key = doi.lower()
+    fetched_at = int(time.time())
+    memory_cache()[key] = (entry, fetched_at)
+    conn, lock = open_cache()
+    with lock, conn:
+        conn.execute("INSERT OR REPLACE INTO crossref VALUES (?, ?, ?)", (key, json.dumps(entry), fetched_at))
+
+
+def iter_doi_batches(dois: list[str]) -> Iterator[list[str]]:
+    # Groups DOIs into filter=doi: requests of at most CROSSREF_BATCH_SIZE DOIs and CROSSREF_MAX_FILTER_LEN characters
+    batch = []
+    length = 0
+    for doi in dois:
+        size = len(doi) + len("doi:,")
+        if batch and (len(batch) == CROSSREF_BATCH_SIZE or length + size > CROSSREF_MAX_FILTER_LEN):
+            yield batch
+            batch = []
+            length = 0
+        batch.append(doi)
+        length += size
+    if batch:
+        yield batch
+
+
+async def fetch_doi_batch(client: httpx.AsyncClient, dois: list[str]) -> tuple[int | None, dict[str, dict] | None]:
+    # Returns the HTTP status (None on a transport error) and the works found, or None if the request failed
+    params = {"filter": ",".join(f"doi:{doi}" for doi in dois), "rows": len(dois)}
+    for delay in (*CROSSREF_BACKOFF, None):
+        try:
+            async with crossref_semaphore:
+                await crossref_limiter.acquire()
+                resp = await client.get(CROSSREF_API, params=params)
+        except httpx.HTTPError:
+            return None, None
+        crossref_limiter.update(resp.headers)
+        if resp.status_code == 200:
+            try:
+                items = resp.json()["message"]["items"]
+                return 200, {item["DOI"].lower(): item for item in items}
+            except (ValueError, KeyError, TypeError, AttributeError):
+                return 200, None
+        if resp.status_code != 429 or delay is None:
+            return resp.status_code, None
+        await asyncio.sleep(delay)
+
+
+async def check_crossref(dois: list[str], on_progress=None) -> tuple[dict[str, dict], set[str]]:
+    """Look up DOIs in Crossref; returns the works found, keyed by lower-cased DOI, and the
+    lower-cased DOIs whose lookup failed (timeout, server error, rate limit), which were not checked.
+
+    on_progress(done, total) is called with the number of DOIs looked up so far as each batch completes.
+    """
+    entries = {}
+    failed = set()
+    missing = []
+    for doi in filter(is_plausible_doi, dois):
+        entry = load_cached(doi)
+        if entry is None:
+            missing.append(doi)
+        elif entry:
+            entries[doi.lower()] = entry
+    if not missing:
+        return entries, failed
+
+    batches = list(iter_doi_batches(missing))
+    # HTTP/2 multiplexes the batches over one connection. The client's connections belong to
+    # the event loop of this run, so it is opened here rather than cached across reruns
+    limits = httpx.Limits(max_connections=CROSSREF_CONCURRENCY, max_keepalive_connections=CROSSREF_CONCURRENCY)
+    async with httpx.AsyncClient(http2=True, limits=limits, timeout=10.0,
+                                 headers={"User-Agent": CROSSREF_USER_AGENT}) as client:
+        pending = {asyncio.ensure_future(fetch_doi_batch(client, batch)): batch for batch in batches}
+        done = len(dois) - len(missing)
+        while pending:
+            finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                batch = pending.pop(task)
+                status_code, found = task.result()
+                if status_code == 400 and len(batch) > 1:
+                    # Crossref rejected the filter, which points at one of its DOIs; retrying them one
+                    # by one lets the others still get checked. Rate limiting, server errors and
+                    # timeouts are not split, as that would only multiply the requests
+                    for doi in batch:
+                        pending[asyncio.ensure_future(fetch_doi_batch(client, [doi]))] = [doi]
+                    continue
+                done += len(batch)
+                if found is None:
+                    # A DOI Crossref rejects on its own is simply not found; anything else wasn't checked
+                    if status_code != 400:
+                        failed.update(doi.lower() for doi in batch)
+                    continue
+                for key, entry in found.items():
+                    store_cached(key, entry)
+                    entries[key] = entry
+                for doi in batch:
+                    if doi.lower() not in found:
+                        store_cached(doi, {})
+            if on_progress:
+                on_progress(done, len(dois))
+    return entries, failed
+
+
+def normalize_for_match(text: str) -> str:
+    # Same result as re.sub(r'\W+', '', text).lower(); ASCII text takes the faster translate path
+    if text.isascii():
+        return text.encode("ascii").translate(_ASCII_LOWER, _ASCII_NONWORD).decode("ascii")
+    return _NONWORD_RE.sub('', text).lower()
+
+
+def is_title_in_reference(crossref_title: str, ref_text: str, tolerance: int = 0,
+                          already_normalized: bool = False) -> tuple[bool, bool]:
+    # already_normalized: ref_text has been through normalize_for_match already
+    ct = normalize_for_match(crossref_title)
+    rt = ref_text if already_normalized else normalize_for_match(ref_text)
 
     if ct in rt:
         return True, False
 
     if len(ct) <= len(rt):
+        # Typos are usually few, so the title's first 20 characters often occur verbatim; str.find
+        # locates that window without scoring any alignment
+        anchor = rt.find(ct[:20])
+        if anchor >= 0:
+            start = min(anchor, len(rt) - len(ct))
+            if Levenshtein.distance(ct, rt[start:start + len(ct)], score_cutoff=tolerance) <= tolerance:
+                return True, True
+        # partial_ratio scores the best len(ct)-long alignment by InDel distance. Each edit costs at
+        # most two InDel operations, so a window within `tolerance` edits scores at least this cutoff
+        cutoff = 100 * (1 - tolerance / len(ct)) - 1e-6
+        alignment = fuzz.partial_ratio_alignment(ct, rt, score_cutoff=cutoff)
+        if alignment is None:
+            return False, False
+        start = max(0, min(alignment.dest_start, len(rt) - len(ct)))
+        if Levenshtein.distance(ct, rt[start:start + len(ct)], score_cutoff=tolerance) <= tolerance:
+            return True, True
+        # The best InDel alignment isn't always the best edit-distance window; check them all
         for i in range(len(rt) - len(ct) + 1):
             window = rt[i:i+len(ct)]
-            if levenshtein(ct, window) <= tolerance:
+            if Levenshtein.distance(ct, window, score_cutoff=tolerance) <= tolerance:
                 return True, True
     else:
-        if levenshtein(ct, rt) <= tolerance:
+        if Levenshtein.distance(ct, rt, score_cutoff=tolerance) <= tolerance:
             return True, True
 
     return False, False
 
 
-def flatten_docx_via_mammoth(doc_bytes: bytes) -> str:
-    result = mammoth.extract_raw_text(BytesIO(doc_bytes))
-    return result.value
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_MC = "{http://schemas.openxmlformats.org/markup-compatibility/2006}"
+# Deleted / moved-away revisions carry no visible text; of mc:AlternateContent only the Fallback is read
+_DOCX_SKIPPED = {_W + "del", _W + "moveFrom", _MC + "Choice"}
+_DOCX_SPECIAL_CHARS = {_W + "tab": "\t", _W + "noBreakHyphen": "-", _W + "softHyphen": ""}
+
+
+def iter_docx_paragraphs(doc_bytes: bytes) -> Iterator[str]:
+    # Streams the paragraph texts of word/document.xml without building the document tree
+    with zipfile.ZipFile(BytesIO(doc_bytes)) as docx, docx.open("word/document.xml") as xml:
+        # One text buffer per open paragraph, so text-box paragraphs don't run into the surrounding one
+        open_paragraphs = [[]]
+        skipped = 0
+        for event, elem in ET.iterparse(xml, events=("start", "end")):
+            tag = elem.tag
+            if tag in _DOCX_SKIPPED:
+                skipped += 1 if event == "start" else -1
+            elif skipped:
+                continue
+            elif tag == _W + "p":
+                if event == "start":
+                    open_paragraphs.append([])
+                else:
+                    yield "".join(open_paragraphs.pop())
+                    elem.clear()
+            elif event == "start":
+                continue
+            elif tag == _W + "t":
+                open_paragraphs[-1].append(elem.text or "")
+            elif tag in _DOCX_SPECIAL_CHARS:
+                open_paragraphs[-1].append(_DOCX_SPECIAL_CHARS[tag])
+
+
+def heading_end(line: str) -> int | None:
+    # Index just past a reference heading that starts the line (followed by a word boundary), if any;
+    # the original rule for where the list starts
+    if line[:1] not in _HEADING_INITIALS:
+        return None
+    head = line[:_HEADING_MAX_LEN + 1].lower()
+    for name in _HEADING_NAMES:
+        following = head[len(name):len(name) + 1]
+        if head.startswith(name) and not (following.isalnum() or following == "_"):
+            return len(name)
+    return None
+
+
+# Both inputs are parsed once per distinct file/text; reruns with the same input hit the cache. The
+# cache lives in the shared server process, so it is kept small and short-lived: uploaded documents
+# and pasted text should not linger in memory
+PARSE_CACHE_ENTRIES = 20
+PARSE_CACHE_TTL = 3600
 
 
+@st.cache_data(show_spinner=False, max_entries=PARSE_CACHE_ENTRIES, ttl=PARSE_CACHE_TTL)
 def get_references_from_docx(doc_bytes: bytes) -> list[str]:
-    text = flatten_docx_via_mammoth(doc_bytes)
-    headings = ["References", "Referenties", "Reference", "Citations", "Bibliography",
-                "Literature Cited", "Sources", "Work cited"]
-    pattern = r'^(?:' + "|".join(headings) + r')\b'
-    match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
-    if match:
-        references_text = text[match.end():].strip()
-        return [r.strip() for r in references_text.split("\n") if r.strip()]
-    return []
+    # The list starts after the last line that is just a heading, which passes over a table of contents
+    # entry such as "References ..... 45"; lines that merely start with a heading word, like a
+    # "Sources: ..." entry in the list, don't restart it. Without such a line, the list starts at the
+    # first line beginning with a heading word
+    after_heading = None
+    after_prefix = None
+    for paragraph in iter_docx_paragraphs(doc_bytes):
+        for line in paragraph.split("\n"):
+            if is_heading_line(line):
+                after_heading = []
+                after_prefix = None
+            elif after_heading is not None:
+                after_heading.append(line)
+            elif after_prefix is not None:
+                after_prefix.append(line)
+            elif (end := heading_end(line)) is not None:
+                after_prefix = [line[end:]]
+    lines = after_heading if after_heading is not None else after_prefix or []
+    return [r.strip() for r in lines if r.strip()]
+
+
+@st.cache_data(show_spinner=False, max_entries=PARSE_CACHE_ENTRIES, ttl=PARSE_CACHE_TTL)
+def get_references_from_text(text: str) -> list[str]:
+    return list(iter_references(text))
 
 
 # ----------------------------------------------------------------------
 # INPUT HANDLING
 # ----------------------------------------------------------------------
 uploaded_file = st.file_uploader("Upload DOCX file (optional):", type=["docx"])
+verbose = st.checkbox("Show details for every reference while checking")
 
 with st.form("paste_form"):
     input_text = st.text_area("Or paste your references here:", height=400,
                               placeholder="Paste references here if not uploading a file")
     submit_paste = st.form_submit_button("Check Pasted References")
 
+# The submitted text is kept so later reruns (the details checkbox, a new typo tolerance) still show results
+if submit_paste:
+    st.session_state["pasted_text"] = input_text
+
 # Determine references based on user action
 if uploaded_file is not None:
     references = get_references_from_docx(uploaded_file.read())
     if not references:
         st.warning("No references found in DOCX.")
         st.stop()
-elif submit_paste and input_text.strip():
-    text_no_heading = remove_heading(input_text)
-    normalized = normalize_text(text_no_heading)
-    references = split_references(normalized)
+elif st.session_state.get("pasted_text", "").strip():
+    references = get_references_from_text(st.session_state["pasted_text"])
 else:
     st.info("📋 Upload a DOCX or paste references and submit to begin")
     st.stop()
@@ -222,50 +548,95 @@ st.markdown(f"### Typo Tolerance Setting: **{st.session_state['wildcard']}**")
 # ----------------------------------------------------------------------
 # PROCESS REFERENCES
 # ----------------------------------------------------------------------
-status = st.info(f"🔎 Found {total} references. Checking...")
-progress = st.progress(0)
+status = st.status(f"🔎 Found {total} references. Checking...", expanded=verbose)
+progress = status.progress(0)
+
+# DOIs are case-insensitive, so a DOI cited more than once (in any casing) is looked up only once
+ref_dois = [extract_doi(r) for r in references]
+unique_dois = list(dict.fromkeys(doi.lower() for doi in ref_dois if doi))
+# Only references with a DOI are compared against a Crossref title
+norm_refs = [normalize_for_match(r) if doi else "" for r, doi in zip(references, ref_dois)]
+
+
+def show_lookup_progress(done: int, total_dois: int):
+    status.update(label=f"🔎 Looked up {done} of {total_dois} DOIs in Crossref...")
+    progress.progress(done / total_dois)
 
-with_doi = no_doi = correct = incorrect = 0
+
+entries, failed_dois = asyncio.run(check_crossref(unique_dois, on_progress=show_lookup_progress))
+
+with_doi = no_doi = correct = incorrect = unchecked = 0
 no_doi_list = []
 incorrect_list = []
+results = []
+
+# Per-reference details are collected as markdown and rendered once after the loop (which does no
+# I/O), and the progress bar moves about 100 times, instead of one message per element per reference
+details_md = []
+progress_step = max(1, total // 100)
 
-for idx, ref in enumerate(references, start=1):
-    st.write(f"**Reference {idx}:**")
-    st.write(ref)
+for idx, (ref, doi, norm_ref) in enumerate(zip(references, ref_dois, norm_refs), start=1):
+    if verbose:
+        details_md.append(f"**Reference {idx}:**")
+        details_md.append(ref)
 
-    doi = extract_doi(ref)
+    title = ""
     if doi:
-        st.write(f"🆔 Extracted DOI: {doi}")
+        if verbose:
+            details_md.append(f"🆔 Extracted DOI: {doi}")
         with_doi += 1
-        entry = check_crossref(doi)
+        entry = entries.get(doi.lower())
         if entry:
             title = entry.get("title", [""])[0] if isinstance(entry.get("title"), list) else entry.get("title", "")
-            st.success(f"✅ Found in Crossref: {title}")
-            matched, wildcard_used = is_title_in_reference(title, ref, tolerance=st.session_state["wildcard"])
+            matched, wildcard_used = is_title_in_reference(title, norm_ref, tolerance=st.session_state["wildcard"],
+                                                           already_normalized=True)
             if matched:
                 if wildcard_used:
-                    st.success(f"✔ Title matches (Typo tolerance applied: {st.session_state['wildcard']})")
+                    result = f"✔ Title matches (Typo tolerance applied: {st.session_state['wildcard']})"
                 else:
-                    st.success("✔ Title matches database")
+                    result = "✔ Title matches database"
                 correct += 1
             else:
-                st.error("❌ Title mismatch")
-                st.warning("⚠ This reference might be incorrect.")
+                result = "❌ Title mismatch"
                 incorrect += 1
                 incorrect_list.append(ref)
+            if verbose:
+                details_md.append(f"✅ Found in Crossref: {title}")
+                if matched:
+                    details_md.append(f":green[{result}]")
+                else:
+                    details_md.append(f":red[{result}]")
+                    details_md.append(":orange[⚠ This reference might be incorrect.]")
+        elif doi.lower() in failed_dois:
+            result = "⚠ Crossref lookup failed, not checked"
+            unchecked += 1
+            if verbose:
+                details_md.append(f":orange[{result}]")
         else:
-            st.error("❌ Not found in Crossref")
+            result = "❌ Not found in Crossref"
             incorrect += 1
             incorrect_list.append(ref)
+            if verbose:
+                details_md.append(f":red[{result}]")
     else:
-        st.warning("⚠ No DOI found")
+        result = "⚠ No DOI found"
         no_doi += 1
         no_doi_list.append(ref)
-
-    progress.progress(idx / total)
-
-progress.progress(1.0)
-status.empty()
+        if verbose:
+            details_md.append(f":orange[{result}]")
+
+    results.append({"#": idx, "Reference": ref, "DOI": doi or "", "Result": result, "Crossref title": title})
+    if idx % progress_step == 0 or idx == total:
+        status.update(label=f"🔎 Checking reference {idx} of {total}...")
+        progress.progress(idx / total)
+
+if verbose:
+    st.markdown("\n\n".join(details_md))
+status.update(label=f"✅ Checked {total} references", state="complete", expanded=False)
+if unchecked:
+    st.warning(f"⚠ {unchecked} reference(s) could not be checked because the Crossref lookup failed "
+               "(timeout, server error or rate limit). They are not counted as incorrect; please try again later.")
+st.dataframe(results, hide_index=True)
 
 
 # ----------------------------------------------------------------------